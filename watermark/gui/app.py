@@ -7,11 +7,18 @@ You can always get the latest version of this module at:
     https://github.com/BoboTiG/watermark-me
 If that URL should fail, try contacting the author.
 """
+import logging
+import signal
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from threading import Thread
+from time import monotonic
+from typing import Any, List, Optional, Set, Tuple
 
-from PyQt5.QtCore import QEvent, QTimer, Qt, QCoreApplication
-from PyQt5.QtGui import QColor, QIcon, QPixmap
+from PyQt5.QtCore import QEvent, QTimer, Qt
+from PyQt5.QtGui import QColor
 from PyQt5.QtWidgets import (
     QAction,
     QColorDialog,
@@ -32,16 +39,23 @@ from PyQt5.QtWidgets import (
 )
 import tinify
 
+from .cache import Cache, cache_file, conf_key
 from .settings import Settings
-from .utils import set_cursor, set_style
+from .utils import SignalsWaker, get_icon, get_pixmap, set_cursor, set_style
+from .worker import Batch
 from ..translator import TR
 from .. import __version__
 from ..conf import CONF
-from ..constants import COMPANY, FREEZER, RES_DIR, TITLE, WINDOWS
-from ..optimizer import optimize, validate_key
-from ..watermark import apply_watermarks
+from ..constants import COMPANY, FREEZER, TITLE, WINDOWS
+from ..optimizer import MAX_REQUESTS, validate_key
 from ..utils import sizeof_fmt
 
+# Delay before comparing again options used to validate the Tinify API key (in seconds)
+VALIDATION_TTL = 60.0
+
+# The About dialog details, computed once
+_ABOUT_DETAILS: Optional[str] = None
+
 
 class MainWindow(QMainWindow):
     """Main window."""
@@ -50,7 +64,7 @@ class MainWindow(QMainWindow):
         super().__init__()
 
         self.setWindowTitle(TITLE)
-        self.setWindowIcon(QIcon(str(RES_DIR / "logo.svg")))
+        self.setWindowIcon(get_icon("logo.svg"))
 
         # Little trick here!
         #
@@ -70,24 +84,51 @@ class MainWindow(QMainWindow):
         # Python process never sees the signal until we hit some button of
         # our Qt application window.
         #
-        # To circumvent this problem is very easy. We just need to set up a timer
-        # kicking off our event loop every few milliseconds.
+        # To circumvent this problem, the C signal handler writes to a socket
+        # watched by the event loop, which then kicks off the Python interpreter
+        # only when a signal is actually delivered.
         #
         # https://machinekoder.com/how-to-not-shoot-yourself-in-the-foot-using-python-qt/
-        self.timer = QTimer()
-        self.timer.timeout.connect(lambda: None)
-        self.timer.start(100)
+        self.signals_waker = SignalsWaker(self)
+
+        # Quit gracefully on CTRL+C, from the event loop
+        signal.signal(signal.SIGINT, lambda *_: QTimer.singleShot(0, qApp.quit))
 
         # Keep track of some metrics
         self.stats = {"count": 0, "size_before": 0, "size_after": 0}
 
+        # Running batches
+        self._batches: List[Batch] = []
+
+        # Status bar updates are coalesced to prevent repaint churn while processing
+        self._status_dirty = False
+        self._status_key: Optional[Tuple[Any, ...]] = None
+        self._status_timer = QTimer(self)
+        self._status_timer.setSingleShot(True)
+        self._status_timer.timeout.connect(self._flush_status)
+
+        # Pictures optimizations are network-bound, they are done concurrently
+        self._optimizer = ThreadPoolExecutor(max_workers=MAX_REQUESTS)
+
+        # Running batches must not outlive the application
+        qApp.aboutToQuit.connect(self._stop_all)
+
+        # Files already processed, the cache is optional
+        self._cache: Optional[Cache] = None
+        try:
+            self._cache = Cache(cache_file())
+        except (OSError, sqlite3.Error):
+            logging.exception("Cannot open the cache, files will be processed again")
+
         # Used to check if picture optimization is enabled and the provided key valid
         self._use_optimization = None
         self._old_key = None
         self._old_state = None
+        self._validate_ts = 0.0
 
         # Init the GUI
         self._settings = Settings()
+        self._settings.applied.connect(self.invalidate_optimization)
         self._toolbar()
         self.addToolBar(self.toolbar)
         self._status_bar()
@@ -101,7 +142,17 @@ class MainWindow(QMainWindow):
 
     @property
     def use_optimization(self) -> bool:
-        """Check if picture optimization is enabled and valid."""
+        """Check if picture optimization is enabled and valid.
+        The key is validated again only when it or the option changed. Options are not
+        even compared during *VALIDATION_TTL* seconds after the last check.
+        """
+        now = monotonic()
+        if (
+            self._use_optimization is not None
+            and now - self._validate_ts < VALIDATION_TTL
+        ):
+            return self._use_optimization
+
         if (
             self._use_optimization is None
             or CONF.tinify_key != self._old_key
@@ -110,14 +161,20 @@ class MainWindow(QMainWindow):
             self._old_key = CONF.tinify_key
             self._old_state = CONF.optimize
             self._use_optimization = CONF.optimize and validate_key(self._old_key)
+        self._validate_ts = now
         return self._use_optimization
 
+    def invalidate_optimization(self) -> None:
+        """Force the picture optimization check at next access."""
+        self._use_optimization = None
+
     def button_ok_state(self) -> None:
         """Handle the state of the OK button. It should be enabled when particular criterias are met."""
 
         self.buttons.setEnabled(
             bool(self.text.text() or self.picture.text())
             and self.paths_list.count() > 0
+            and not self._batches
         )
 
     def _check_for_update(self) -> None:
@@ -154,16 +211,36 @@ class MainWindow(QMainWindow):
         self.status_bar.setSizeGripEnabled(False)
 
     def _status_msg(self, msg: str = "") -> None:
-        """Display statistics in the status bar."""
-        if not msg:
+        """Display statistics in the status bar.
+        The statistics message is not computed nor displayed again if nothing changed.
+        """
+        if msg:
+            self._status_key = None
+        else:
+            use_optimization = self.use_optimization
+            key = (
+                self.stats["count"],
+                self.stats["size_before"],
+                self.stats["size_after"],
+                use_optimization and tinify.compression_count,
+            )
+            if key == self._status_key:
+                return
+            self._status_key = key
+
             win = self.stats["size_before"] - self.stats["size_after"]
             values = [str(self.stats["count"]), sizeof_fmt(win, suffix=TR.get("BYTE"))]
             msg = TR.get("STATISTICS", values)
-            if self.use_optimization:
+            if use_optimization:
                 msg += TR.get("STATISTICS_TINIFY", [tinify.compression_count])
 
         self.status_bar.showMessage(msg)
-        QCoreApplication.processEvents()  # Important, keep it!
+
+    def _flush_status(self) -> None:
+        """Display statistics in the status bar, if they changed since the last time."""
+        if self._status_dirty:
+            self._status_dirty = False
+            self._status_msg()
 
     def _toolbar(self) -> QToolBar:
         """Create the toolbar."""
@@ -172,23 +249,19 @@ class MainWindow(QMainWindow):
         self.toolbar.setMovable(False)
 
         # Icon: settings
-        settings_action = QAction(
-            QIcon(str(RES_DIR / "settings.svg")), TR.get("TB_SETTINGS"), self
-        )
+        settings_action = QAction(get_icon("settings.svg"), TR.get("TB_SETTINGS"), self)
         settings_action.triggered.connect(self._settings.exec_)
         self.toolbar.addAction(settings_action)
 
         # Icon: about
-        about_action = QAction(
-            QIcon(str(RES_DIR / "about.svg")), TR.get("TB_ABOUT"), self
-        )
+        about_action = QAction(get_icon("about.svg"), TR.get("TB_ABOUT"), self)
         about_action.triggered.connect(show_about)
         self.toolbar.addAction(about_action)
 
         self.toolbar.addSeparator()
 
         # Icon: exit
-        exit_action = QAction(QIcon(str(RES_DIR / "exit.svg")), TR.get("TB_EXIT"), self)
+        exit_action = QAction(get_icon("exit.svg"), TR.get("TB_EXIT"), self)
         exit_action.triggered.connect(qApp.quit)
         self.toolbar.addAction(exit_action)
 
@@ -207,9 +280,7 @@ class MainWindow(QMainWindow):
         vbox.addWidget(self.text)
 
         # The color picker button
-        self.btn_pick_color = QPushButton(
-            QIcon(str(RES_DIR / "color.svg")), TR.get("COLOR")
-        )
+        self.btn_pick_color = QPushButton(get_icon("color.svg"), TR.get("COLOR"))
         set_cursor(self.btn_pick_color)
         self.btn_pick_color.setAutoFillBackground(True)
         self.btn_pick_color.clicked.connect(self._color_picker_dlg.show)
@@ -235,9 +306,7 @@ class MainWindow(QMainWindow):
         vbox.addWidget(self.picture)
 
         # The button to choose a local file
-        btn_choose_file = QPushButton(
-            QIcon(str(RES_DIR / "open.svg")), TR.get("CHOOSE")
-        )
+        btn_choose_file = QPushButton(get_icon("open.svg"), TR.get("CHOOSE"))
         set_cursor(btn_choose_file)
         btn_choose_file.setFlat(True)
         btn_choose_file.clicked.connect(self._select_one_file)
@@ -304,34 +373,25 @@ class MainWindow(QMainWindow):
         CONF.text = self.text.text()
         CONF.picture = self.picture.text()
 
-        paths = [
-            Path(self.paths_list.item(i).text()) for i in range(self.paths_list.count())
-        ]
-        if not paths:
+        if not self.paths_list.count():
             return
 
-        # Add watermark(s) to all files
-        for path_orig, path_new in apply_watermarks(paths, CONF.text, CONF.picture):
-            if not path_new:
-                continue
+        # Snapshot the options, the batch will not look at the GUI
+        use_optimization = self.use_optimization
+        batch = Batch(
+            CONF.text,
+            CONF.picture,
+            optimizer=self._optimizer if use_optimization else None,
+            cache=self._cache,
+            conf=conf_key(CONF.text, CONF.picture, use_optimization),
+        )
+        batch.signals.fileDone.connect(self._file_done)
+        batch.signals.allDone.connect(partial(self._batch_done, batch))
+        self._batches.append(batch)
 
-            # Optimize the picture
-            if self.use_optimization:
-                path_new_optimized = optimize(path_new)
-                if path_new_optimized:
-                    # Delete the "-w.jpg"
-                    path_new.unlink()
-                    # Keep the new "-wo.jpg"
-                    path_new = path_new_optimized
-
-            # Update statistics
-            self.stats["count"] += 1
-            self.stats["size_before"] += path_orig.stat().st_size
-            self.stats["size_after"] += path_new.stat().st_size
-
-            # Update the status bar message
-            self._status_msg()
-            QCoreApplication.processEvents()  # Important, keep it!
+        # Add watermark(s) to all files, outside of the GUI thread.
+        # Paths are streamed so that the first job starts as soon as possible.
+        batch.start(self.paths_list.paths())
 
         # Empty the paths to handle
         self.paths_list.clear()
@@ -339,6 +399,33 @@ class MainWindow(QMainWindow):
         # And update the OK button state
         self.button_ok_state()
 
+    def _file_done(
+        self, path_orig: Path, path_new: Path, size_before: int, size_after: int
+    ) -> None:
+        """A file has been processed."""
+        # Update statistics
+        self.stats["count"] += 1
+        self.stats["size_before"] += size_before
+        self.stats["size_after"] += size_after
+
+        # Schedule a status bar message update
+        self._status_dirty = True
+        if not self._status_timer.isActive():
+            self._status_timer.start(100)
+
+    def _batch_done(self, batch: Batch) -> None:
+        """A batch has finished."""
+        self._batches.remove(batch)
+        self.button_ok_state()
+
+    def _stop_all(self) -> None:
+        """Stop running batches, and pending optimizations, the application is about to quit.
+        Only files being processed right now are finished.
+        """
+        for batch in self._batches:
+            batch.stop()
+        self._optimizer.shutdown(wait=False)
+
 
 class DroppableQList(QListWidget):
     def __init__(self, parent: MainWindow) -> None:
@@ -346,14 +433,34 @@ class DroppableQList(QListWidget):
 
         self.parent = parent
 
+        # Mirror of the items text, for fast lookups
+        self._paths: Set[str] = set()
+
         # Accept drag'n drop
         self.setAcceptDrops(True)
 
         # Automatically sort the list
         self.setSortingEnabled(True)
 
+    def _add_path(self, path: str) -> None:
+        """Add a *path* to the list, and to its mirror.
+        Items must be added only from here, else they would not be processed.
+        """
+        self.addItem(path)
+        self._paths.add(path)
+
+    def clear(self) -> None:
+        super().clear()
+        self._paths.clear()
+
     def exists(self, path: str) -> bool:
-        return any(self.item(i).text() == path for i in range(self.count()))
+        return path in self._paths
+
+    def paths(self) -> List[str]:
+        """Return all paths without querying items one by one.
+        Paths are sorted by code point, which may differ from the locale-aware order of the list.
+        """
+        return sorted(self._paths)
 
     def dragEnterEvent(self, event: QEvent) -> None:
         if event.mimeData().hasUrls:
@@ -371,7 +478,7 @@ class DroppableQList(QListWidget):
             path = url.toLocalFile()
             if self.exists(path):
                 continue
-            self.addItem(path)
+            self._add_path(path)
         event.accept()
 
         # Check the OK button, it may need to be enabled
@@ -380,29 +487,36 @@ class DroppableQList(QListWidget):
 
 def show_about() -> None:
     """display a simple "About" dialog."""
-    icon = str(RES_DIR / "logo.svg")
-
     msg = QMessageBox()
     msg.setWindowTitle(TR.get("TITLE_ABOUT", [TITLE]))
-    msg.setWindowIcon(QIcon(icon))
-    msg.setIconPixmap(QPixmap(icon).scaledToWidth(64))
+    msg.setWindowIcon(get_icon("logo.svg"))
+    msg.setIconPixmap(get_pixmap("logo.svg", 64))
 
     msg.setText(f"{TITLE} v{__version__}")
     codename = TR.get("CODENAME", ["Colossos"])
     msg.setInformativeText(f"{codename}\n© 2019-2020 {COMPANY}")
 
-    from platform import python_implementation, python_version
-
-    msg.setDetailedText(
-        f"{python_implementation()} {python_version()}\n"
-        f"Pillow 7.0.0\n"
-        f"PyInstaller 3.6\n"
-        f"PyQt5 5.13.2\n"
-        f"PyYAML 5.3\n"
-        f"Tendo 0.2.15\n"
-        f"Tinify 1.5.1"
-    )
+    msg.setDetailedText(about_details())
 
     msg.setStandardButtons(QMessageBox.Close)
     set_cursor(msg.button(QMessageBox.Close))
     msg.exec_()
+
+
+def about_details() -> str:
+    """Versions of Python and main modules, displayed in the About dialog details."""
+    global _ABOUT_DETAILS
+
+    if _ABOUT_DETAILS is None:
+        from platform import python_implementation, python_version
+
+        _ABOUT_DETAILS = (
+            f"{python_implementation()} {python_version()}\n"
+            f"Pillow 7.0.0\n"
+            f"PyInstaller 3.6\n"
+            f"PyQt5 5.13.2\n"
+            f"PyYAML 5.3\n"
+            f"Tendo 0.2.15\n"
+            f"Tinify 1.5.1"
+        )
+    return _ABOUT_DETAILS
@@ -0,0 +1,126 @@
+"""
+GUI to watermark your pictures with text and/or another picture.
+
+This module is maintained by Mickaël Schoentgen <contact@tiger-222.fr>.
+
+You can always get the latest version of this module at:
+    https://github.com/BoboTiG/watermark-me
+If that URL should fail, try contacting the author.
+"""
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from typing import Optional, Tuple
+
+from PyQt5.QtCore import QStandardPaths
+
+from ..conf import CONF
+from ..constants import PRODUCT
+
+
+def cache_file() -> Path:
+    """Get the cache database file."""
+    folder = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation)
+    return Path(folder) / PRODUCT / "cache.db"
+
+
+def conf_key(text: str, picture: str, optimize: bool) -> str:
+    """Compute a key identifying options used to process files.
+    The picture watermark modification time is part of it, to catch changes of the file itself.
+    A missing picture is not an error here, files will fail to be processed anyway.
+    """
+    try:
+        picture_mtime = os.stat(picture).st_mtime_ns if picture else 0
+    except OSError:
+        picture_mtime = 0
+    options = (
+        text,
+        picture,
+        picture_mtime,
+        CONF.font,
+        CONF.opacity,
+        CONF.text_color,
+        optimize,
+    )
+    return hashlib.sha1(repr(options).encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """Remember files already processed with given options (see conf_key()), so that
+    they can be skipped when processed again while unchanged.
+    Entries are keyed by the original file path, modification time and size.
+    Only outputs actually generated with given options must be stored, existing outputs
+    are never generated again and may come from other options.
+    Methods can be called from any thread.
+    """
+
+    def __init__(self, file: Path) -> None:
+        file.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(file), check_same_thread=False)
+        with self._lock, self._conn:
+            # It is only a cache, losing recent entries on a crash is fine
+            self._conn.execute("PRAGMA synchronous = OFF")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "   path TEXT,"
+                "   conf TEXT,"
+                "   mtime INTEGER,"
+                "   size INTEGER,"
+                "   output TEXT,"
+                "   output_size INTEGER,"
+                "   PRIMARY KEY (path, conf)"
+                ")"
+            )
+
+    def lookup(self, file: Path, conf: str) -> Optional[Tuple[Path, int, int]]:
+        """Get the result of a previous processing of a given *file* with given *conf* options.
+        Return a tuple (output file, original size, output size), or None when the file
+        changed since, or if the output file does not exist anymore.
+        """
+        path = os.path.abspath(file)
+        stat = os.stat(path)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime, size, output, output_size FROM files WHERE path = ? AND conf = ?",
+                (path, conf),
+            ).fetchone()
+        if not row:
+            return None
+
+        mtime, size, output, output_size = row
+        if (mtime, size) == (stat.st_mtime_ns, stat.st_size):
+            try:
+                if os.stat(output).st_size == output_size:
+                    return Path(output), size, output_size
+            except OSError:
+                pass
+
+        # Outdated entry
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM files WHERE path = ? AND conf = ?", (path, conf)
+            )
+        return None
+
+    def put(self, file: Path, conf: str, output: Path, output_size: int) -> None:
+        """Remember the *output* of the processing of a given *file* with given *conf* options."""
+        path = os.path.abspath(file)
+        stat = os.stat(path)
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    conf,
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    os.path.abspath(output),
+                    output_size,
+                ),
+            )
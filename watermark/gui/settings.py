@@ -10,8 +10,7 @@ If that URL should fail, try contacting the author.
 
 from functools import partial
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import (
     QDialog,
     QDialogButtonBox,
@@ -29,20 +28,23 @@ from PyQt5.QtWidgets import (
     QWidget,
 )
 
-from .utils import set_cursor, set_style
+from .utils import get_icon, set_cursor, set_style
 from ..conf import CONF, save_config
-from ..constants import RES_DIR, TITLE
+from ..constants import TITLE
 from ..translator import TR
 
 
 class Settings(QDialog):
     """Settings window."""
 
+    # Emitted when changes are applied
+    applied = pyqtSignal()
+
     def __init__(self) -> None:
         super().__init__()
 
         self.setWindowTitle(TR.get("TITLE_SETTINGS", [TITLE]))
-        self.setWindowIcon(QIcon(str(RES_DIR / "logo.svg")))
+        self.setWindowIcon(get_icon("logo.svg"))
 
         self.conf = type(CONF)(**vars(CONF).copy())
 
@@ -148,7 +150,7 @@ class Settings(QDialog):
         font.setReadOnly(True)
         font.textChanged.connect(lambda t: setattr(self.conf, "font", t))
         set_style(font)
-        icon = QIcon(str(RES_DIR / "open.svg"))
+        icon = get_icon("open.svg")
         select = QPushButton(icon, TR.get("CHOOSE"), self)
         set_cursor(select)
         select.setFlat(True)
@@ -183,6 +185,7 @@ class Settings(QDialog):
             setattr(CONF, option, value)
 
         save_config()
+        self.applied.emit()
 
     def choose_font(self) -> str:
         """Select a font file."""
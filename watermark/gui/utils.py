@@ -7,9 +7,28 @@ You can always get the latest version of this module at:
     https://github.com/BoboTiG/watermark-me
 If that URL should fail, try contacting the author.
 """
-from PyQt5.QtCore import Qt, QObject
-from PyQt5.QtGui import QCursor
+import signal
+import socket
+from functools import lru_cache
+
+from PyQt5.QtCore import Qt, QObject, QSocketNotifier
+from PyQt5.QtGui import QCursor, QIcon, QPixmap
 from PyQt5.QtWidgets import QLineEdit
+from PyQt5.sip import voidptr
+
+from ..constants import RES_DIR
+
+
+@lru_cache(maxsize=None)
+def get_icon(name: str) -> QIcon:
+    """Get the icon *name* from resources. SVG files are parsed only once."""
+    return QIcon(str(RES_DIR / name))
+
+
+@lru_cache(maxsize=None)
+def get_pixmap(name: str, width: int) -> QPixmap:
+    """Get the picture *name* from resources, scaled to the given *width*."""
+    return QPixmap(str(RES_DIR / name)).scaledToWidth(width)
 
 
 def set_cursor(obj: QObject, cursor: QCursor = Qt.PointingHandCursor) -> None:
@@ -20,3 +39,27 @@ def set_cursor(obj: QObject, cursor: QCursor = Qt.PointingHandCursor) -> None:
 def set_style(line: QLineEdit) -> None:
     """Set the line edit style."""
     line.setStyleSheet("QLineEdit{padding: 5px 10px}")
+
+
+class SignalsWaker(QSocketNotifier):
+    """Let the Qt event loop run the Python interpreter when a signal is received,
+    so that Python signal handlers are called without waiting for a GUI event.
+    The object must be kept alive, it owns the sockets the signals are written to.
+    """
+
+    def __init__(self, parent: QObject) -> None:
+        self.rsock, self.wsock = socket.socketpair()
+        self.rsock.setblocking(False)
+        self.wsock.setblocking(False)
+
+        super().__init__(voidptr(self.rsock.fileno()), QSocketNotifier.Read, parent)
+        self.activated.connect(self._drain)
+
+        signal.set_wakeup_fd(self.wsock.fileno())
+
+    def _drain(self) -> None:
+        # Python signal handlers are run right before this
+        try:
+            self.rsock.recv(1024)
+        except OSError:
+            pass
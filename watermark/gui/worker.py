@@ -0,0 +1,308 @@
+"""
+GUI to watermark your pictures with text and/or another picture.
+
+This module is maintained by Mickaël Schoentgen <contact@tiger-222.fr>.
+
+You can always get the latest version of this module at:
+    https://github.com/BoboTiG/watermark-me
+If that URL should fail, try contacting the author.
+"""
+import logging
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from queue import Queue
+from tempfile import mkdtemp
+from threading import Event, Lock, Thread
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from .cache import Cache
+from ..optimizer import optimize
+from ..utils import guess_output, is_remote, read_mounts, staged_output
+from ..watermark import apply_watermarks, iter_files
+
+# A watermarked file: path_orig, path_new, size_before, size_after, found in the cache,
+# generated now (False when the file already existed, maybe with other options)
+Result = Tuple[Path, Path, int, int, bool, bool]
+
+
+class WorkerSignals(QObject):
+    """Signals emitted by a Batch, they are delivered to the GUI thread."""
+
+    # path_orig, path_new, size_before, size_after
+    fileDone = pyqtSignal(object, object, int, int)
+    allDone = pyqtSignal()
+
+
+class Batch:
+    """Process files outside of the GUI thread, using a two-stage pipeline:
+
+        - watermarking (CPU-bound) is done by one WatermarkJob per file, running in the global QThreadPool;
+        - optimization (network-bound) is done using the *optimizer* pool, if given.
+
+    Watermarked files go from the first stage to the second one through a bounded queue,
+    so that both stages are kept busy at the same time.
+
+    When a *cache* is given, files already processed with the same options, identified
+    by *conf*, are skipped.
+
+    A batch can be stopped with stop(), signals are not emitted anymore afterwards.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        picture: str,
+        optimizer: Optional[ThreadPoolExecutor] = None,
+        cache: Optional[Cache] = None,
+        conf: str = "",
+    ) -> None:
+        self.text = text
+        self.picture = picture
+        self.optimizer = optimizer
+        self.cache = cache
+        self.conf = conf
+        self.signals = WorkerSignals()
+
+        self.queue: "Queue[Optional[Result]]" = Queue(maxsize=32)
+        self.staging = Path(mkdtemp(prefix="wm_"))
+
+        # Jobs not done yet, the dispatcher counts as one until all files are dispatched
+        self._pending = 1
+        self._lock = Lock()
+
+        self._stopped = Event()
+        self._futures: List[Future] = []
+
+    def start(self, paths: Iterable[str]) -> None:
+        """Start processing given *paths*, it can be a generator.
+        Path objects are created, and folders walked, outside of the GUI thread.
+        """
+        Thread(target=self._dispatch, args=(paths,)).start()
+        Thread(target=self._consume).start()
+
+    def stop(self) -> None:
+        """Stop processing files. Files being processed are finished, but not reported."""
+        with self._lock:
+            self._stopped.set()
+        for future in list(self._futures):
+            future.cancel()
+
+    @property
+    def stopped(self) -> bool:
+        """Check if the batch has been stopped."""
+        return self._stopped.is_set()
+
+    def _emit(self, signal: str, *args: Any) -> None:
+        """Emit a given *signal*, unless the batch has been stopped.
+        The check is done under the lock so that nothing is emitted once stop() returned,
+        signals may be deleted then.
+        """
+        with self._lock:
+            if not self.stopped:
+                getattr(self.signals, signal).emit(*args)
+
+    def _dispatch(self, paths: Iterable[str]) -> None:
+        """Start one WatermarkJob per file found in given *paths*."""
+        pool = QThreadPool.globalInstance()
+        outputs: Set[Path] = set()
+        remotes: Dict[Path, bool] = {}
+        mounts = read_mounts()
+
+        try:
+            for file in iter_files(paths):
+                if self.stopped:
+                    break
+
+                output = guess_output(file)
+                if output != file:
+                    # Files would be written simultaneously (like "a.jpg" and "a.png" to "a-w.jpg")
+                    if output in outputs:
+                        logging.warning(f"Skipping {file}, {output} is already used")
+                        continue
+                    outputs.add(output)
+
+                folder = file.parent
+                if folder not in remotes:
+                    remotes[folder] = use_staging(folder, mounts=mounts)
+                staging = self.staging if remotes[folder] else None
+
+                with self._lock:
+                    self._pending += 1
+                pool.start(WatermarkJob(file, self, staging))
+        except Exception:
+            logging.exception("Cannot dispatch files")
+        finally:
+            self.queue.put(None)
+
+    def _consume(self) -> None:
+        """Handle watermarked files until all jobs are done.
+        The queue is always drained, else pending jobs would be blocked forever.
+        """
+        futures = self._futures
+
+        try:
+            while True:
+                result = self.queue.get()
+                if result is None:
+                    # End of stream for a job
+                    with self._lock:
+                        self._pending -= 1
+                        if not self._pending:
+                            break
+                    continue
+
+                if self.stopped:
+                    continue
+
+                try:
+                    future = self._handle(*result)
+                except Exception:
+                    logging.exception(f"Cannot handle {result[0]}")
+                else:
+                    if future:
+                        futures.append(future)
+
+            # Staged files may still be written, wait for all optimizations
+            for future in wait(futures).done:
+                exc = None if future.cancelled() else future.exception()
+                if exc:
+                    logging.error("Optimization failed", exc_info=exc)
+        finally:
+            shutil.rmtree(self.staging, ignore_errors=True)
+            self._emit("allDone")
+
+    def _handle(
+        self,
+        path_orig: Path,
+        path_new: Path,
+        size_orig: int,
+        size_new: int,
+        cached: bool,
+        fresh: bool,
+    ) -> Optional[Future]:
+        """Handle a watermarked file, return the optimization future, if any."""
+        if cached:
+            # Already processed, path_new is the final file
+            self._emit("fileDone", path_orig, path_new, size_orig, size_new)
+        elif self.optimizer:
+            return self.optimizer.submit(
+                self._optimize, path_orig, path_new, size_orig, size_new, fresh
+            )
+        else:
+            output = guess_output(path_orig)
+            self._done(path_orig, path_new, size_orig, size_new, output, cache=fresh)
+        return None
+
+    def _optimize(
+        self,
+        path_orig: Path,
+        path_new: Path,
+        size_orig: int,
+        size_new: int,
+        fresh: bool,
+    ) -> None:
+        """Optimize a watermarked file, this is the second stage."""
+        if self.stopped:
+            return
+
+        output = guess_output(path_orig)
+        output_optimized = guess_output(output, optimized=True)
+        fresh = fresh and not output_optimized.is_file()
+
+        # Use the staging folder only if it was used for the watermarked file
+        staging = self.staging if path_new.parent == self.staging else None
+        try:
+            optimized = optimize(
+                path_new, output=staged_output(output_optimized, staging)
+            )
+        except Exception:
+            # Keep the watermarked file
+            logging.exception(f"Cannot optimize {path_new}")
+            optimized = None
+
+        if optimized:
+            # Delete the "-w.jpg"
+            path_new.unlink()
+            # Keep the new "-wo.jpg"
+            path_new, size_new = optimized
+            output = output_optimized
+
+        # Failed optimizations are not cached, to be retried next time
+        self._done(
+            path_orig,
+            path_new,
+            size_orig,
+            size_new,
+            output,
+            cache=fresh and bool(optimized),
+        )
+
+    def _done(
+        self,
+        path_orig: Path,
+        path_new: Path,
+        size_orig: int,
+        size_new: int,
+        output: Path,
+        cache: bool = True,
+    ) -> None:
+        """Notify the GUI that a file has been processed.
+        *output* is the final destination of *path_new*, a staged file is moved there right now.
+        Only files generated by this batch are cached, as existing ones may come from other options.
+        """
+        if path_new != output:
+            shutil.move(str(path_new), str(output))
+        self._emit("fileDone", path_orig, output, size_orig, size_new)
+        if cache and self.cache:
+            self.cache.put(path_orig, self.conf, output, size_new)
+
+
+class WatermarkJob(QRunnable):
+    """Apply watermark(s) on a given *file*, this is the first stage of a *batch*.
+    The watermarked file is put into the batch queue, followed by None when done.
+    When *staging* is set, the watermarked file is written into that folder.
+    """
+
+    def __init__(self, file: Path, batch: Batch, staging: Optional[Path]) -> None:
+        super().__init__()
+
+        self.file = file
+        self.batch = batch
+        self.staging = staging
+
+    def run(self) -> None:
+        batch = self.batch
+        try:
+            if batch.stopped:
+                return
+
+            cached = batch.cache.lookup(self.file, batch.conf) if batch.cache else None
+            if cached:
+                batch.queue.put((self.file, *cached, True, False))
+                return
+
+            # Existing files are not generated again
+            fresh = not guess_output(self.file).is_file()
+
+            for path_orig, path_new, size_orig, size_new in apply_watermarks(
+                [self.file], batch.text, batch.picture, staging=self.staging
+            ):
+                if path_new:
+                    batch.queue.put(
+                        (path_orig, path_new, size_orig, size_new, False, fresh)
+                    )
+        except Exception:
+            logging.exception(f"Cannot watermark {self.file}")
+        finally:
+            batch.queue.put(None)
+
+
+def use_staging(folder: Path, mounts: Optional[str] = None) -> bool:
+    """Check if files generated into a given *folder* should be written to a local staging folder first.
+    This is the case when the destination is a network share, so that files are sent
+    with a sequential copy, once final. See is_remote() for *mounts*.
+    """
+    return is_remote(folder, mounts=mounts)
@@ -8,12 +8,17 @@ You can always get the latest version of this module at:
 If that URL should fail, try contacting the author.
 """
 from pathlib import Path
-from typing import Optional
+from threading import Semaphore
+from typing import Optional, Tuple
 
 import tinify
 
 from .utils import guess_output
 
+# Maximum simultaneous requests to the Tinify API
+MAX_REQUESTS = 8
+_REQUESTS = Semaphore(MAX_REQUESTS)
+
 
 def validate_key(key: str) -> bool:
     """Validate the Tinify API key."""
@@ -27,18 +32,25 @@ def validate_key(key: str) -> bool:
         return False
 
 
-def optimize(file: Path, retry: int = 3) -> Optional[Path]:
-    """Optimize a given *file* using the Tinify API."""
+def optimize(
+    file: Path, retry: int = 3, output: Optional[Path] = None
+) -> Optional[Tuple[Path, int]]:
+    """Optimize a given *file* using the Tinify API.
+    The result is saved to *output*, guessed from *file* when not specified.
+    Return the optimized file and its size.
+    """
 
     # Last retry, all previous attemps failed
     if retry < 0:
         return None
 
-    output = guess_output(file, optimized=True)
+    output = output or guess_output(file, optimized=True)
 
     # Already processed
-    if output.is_file():
-        return output
+    try:
+        return output, output.stat().st_size
+    except FileNotFoundError:
+        pass
 
     # No enough credits for this month :/
     # Note: this is for the free account only.
@@ -46,9 +58,11 @@ def optimize(file: Path, retry: int = 3) -> Optional[Path]:
         return None
 
     try:
-        tinify.from_file(str(file)).to_file(str(output))
+        with _REQUESTS:
+            data = tinify.from_file(str(file)).to_buffer()
     except (tinify.ServerError, tinify.ConnectionError):
         # Network issue, retry
-        return optimize(file, retry=retry - 1)
+        return optimize(file, retry=retry - 1, output=output)
 
-    return output
+    output.write_bytes(data)
+    return output, len(data)
@@ -0,0 +1,116 @@
+"""
+GUI to watermark your pictures with text and/or another picture.
+
+This module is maintained by Mickaël Schoentgen <contact@tiger-222.fr>.
+
+You can always get the latest version of this module at:
+    https://github.com/BoboTiG/watermark-me
+If that URL should fail, try contacting the author.
+"""
+import os
+from pathlib import Path
+from typing import Tuple
+
+import pytest
+from watermark.conf import CONF
+from watermark.gui.cache import Cache, conf_key
+
+
+@pytest.fixture
+def files(tmp_path) -> Tuple[Path, Path]:
+    """Return an original file (8 bytes) and its output (11 bytes)."""
+    file = tmp_path / "file.png"
+    file.write_bytes(b"original")
+    output = tmp_path / "file-w.jpg"
+    output.write_bytes(b"watermarked")
+    return file, output
+
+
+def test_cache_hit(tmp_path, files):
+    """Test a file processed with the same options."""
+    file, output = files
+    cache = Cache(tmp_path / "cache" / "cache.db")
+
+    assert cache.lookup(file, "conf") is None
+
+    cache.put(file, "conf", output, 11)
+    assert cache.lookup(file, "conf") == (output, 8, 11)
+
+    # Other options
+    assert cache.lookup(file, "other conf") is None
+
+
+def test_cache_persistence(tmp_path, files):
+    """Test entries are kept between sessions."""
+    file, output = files
+    db = tmp_path / "cache.db"
+
+    Cache(db).put(file, "conf", output, 11)
+    assert Cache(db).lookup(file, "conf") == (output, 8, 11)
+
+
+def test_cache_outdated(tmp_path, files):
+    """Test a file modified since it was processed."""
+    file, output = files
+    cache = Cache(tmp_path / "cache.db")
+    cache.put(file, "conf", output, 11)
+
+    stat = file.stat()
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.lookup(file, "conf") is None
+
+    # The outdated entry was removed
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.lookup(file, "conf") is None
+
+
+def test_cache_output_changed(tmp_path, files):
+    """Test an output file modified since it was generated."""
+    file, output = files
+    cache = Cache(tmp_path / "cache.db")
+    cache.put(file, "conf", output, 11)
+
+    output.write_bytes(b"modified")
+    assert cache.lookup(file, "conf") is None
+
+
+def test_cache_output_removed(tmp_path, files):
+    """Test an output file removed since it was generated."""
+    file, output = files
+    cache = Cache(tmp_path / "cache.db")
+    cache.put(file, "conf", output, 11)
+
+    output.unlink()
+    assert cache.lookup(file, "conf") is None
+
+
+def test_conf_key(picture):
+    """Test the options key changes with options."""
+    key = conf_key("text", "", False)
+    assert key == conf_key("text", "", False)
+    assert key != conf_key("other text", "", False)
+    assert key != conf_key("text", "", True)
+    assert key != conf_key("text", picture, False)
+
+    opacity = CONF.opacity
+    try:
+        CONF.opacity = opacity / 2
+        assert key != conf_key("text", "", False)
+    finally:
+        CONF.opacity = opacity
+
+
+def test_conf_key_picture_changed(tmp_path):
+    """Test the options key changes with the picture watermark file."""
+    watermark = tmp_path / "watermark.png"
+    watermark.write_bytes(b"picture")
+    key = conf_key("", str(watermark), False)
+
+    stat = watermark.stat()
+    os.utime(watermark, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert key != conf_key("", str(watermark), False)
+
+
+def test_conf_key_picture_missing(tmp_path):
+    """Test the options key with a picture watermark that does not exist."""
+    assert conf_key("", str(tmp_path / "missing.png"), False)
@@ -7,7 +7,6 @@ You can always get the latest version of this module at:
     https://github.com/BoboTiG/watermark-me
 If that URL should fail, try contacting the author.
 """
-from pathlib import Path
 from unittest.mock import patch
 
 import tinify
@@ -28,8 +27,8 @@ def test_optimize(tmp_path, png):
         def from_file(cls, path):
             return cls()
 
-        def to_file(self, path):
-            Path(path).touch()
+        def to_buffer(self):
+            return b"optimized"
 
     def from_file(path):
         return SourceMocked.from_file(path)
@@ -37,12 +36,13 @@ def test_optimize(tmp_path, png):
     tinify.compression_count = 0
 
     with patch.object(tinify, "from_file", new=from_file):
-        optimized = optimize(watermarked)
+        optimized, size = optimize(watermarked)
 
     assert optimized.is_file()
+    assert size == optimized.stat().st_size == len(b"optimized")
 
     # Already done
-    assert optimize(optimized).name == optimized.name
+    assert optimize(optimized) == (optimized, size)
 
 
 def test_optimize_no_more_compression_counts(tmp_path, png):
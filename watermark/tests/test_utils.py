@@ -10,7 +10,14 @@ If that URL should fail, try contacting the author.
 from pathlib import Path
 
 import pytest
-from watermark.utils import guess_output, sizeof_fmt
+from watermark.constants import LINUX
+from watermark.utils import (
+    guess_output,
+    is_remote,
+    mount_fs_type,
+    sizeof_fmt,
+    staged_output,
+)
 
 
 @pytest.mark.parametrize(
@@ -26,15 +33,52 @@ def test_guess_output(file, expected, optimized):
     assert guess_output(file, optimized=optimized) == expected
 
 
+MOUNTS = """\
+/dev/sda1 / ext4 rw,relatime 0 0
+tmpfs /tmp tmpfs rw,nosuid,nodev 0 0
+server:/photos /mnt/photos nfs4 rw,relatime 0 0
+//nas/my\\040share /mnt/my\\040share cifs rw,relatime 0 0
+/dev/sdb1 /mnt/photos/local ext4 rw,relatime 0 0
+"""
+
+
+@pytest.mark.parametrize(
+    "path, fs_type",
+    [
+        ("/", "ext4"),
+        ("/home/user/picture.jpg", "ext4"),
+        ("/tmp", "tmpfs"),
+        ("/tmpfoo", "ext4"),
+        ("/mnt/photos/2020", "nfs4"),
+        ("/mnt/my share/picture.jpg", "cifs"),
+        ("/mnt/photos/local/picture.jpg", "ext4"),
+    ],
+)
+def test_mount_fs_type(path, fs_type):
+    assert mount_fs_type(Path(path), MOUNTS) == fs_type
+
+
+@pytest.mark.skipif(not LINUX, reason="Linux only")
+def test_is_remote_with_mounts():
+    """Test network shares detection using a given /proc/mounts content."""
+    assert is_remote(Path("/mnt/photos/2020"), mounts=MOUNTS)
+    assert is_remote(Path("/mnt/my share"), mounts=MOUNTS)
+    assert not is_remote(Path("/mnt/photos/local"), mounts=MOUNTS)
+    assert not is_remote(Path("/tmp"), mounts=MOUNTS)
+
+
 @pytest.mark.parametrize(
     "size, result",
     [
         (0, "0.0 B"),
         (1, "1.0 B"),
+        (1023, "1023.0 B"),
         (-1024, "-1.0 KiB"),
         (1024, "1.0 KiB"),
         (1024 * 1024, "1.0 MiB"),
         (pow(1024, 2), "1.0 MiB"),
+        (pow(1024, 2) - 1, "1024.0 KiB"),
+        (pow(2, 60) - 1, "1.0 EiB"),
         (pow(1024, 3), "1.0 GiB"),
         (pow(1024, 4), "1.0 TiB"),
         (pow(1024, 5), "1.0 PiB"),
@@ -52,3 +96,19 @@ def test_sizeof_fmt(size, result):
 
 def test_sizeof_fmt_custom_suffix():
     assert sizeof_fmt(168_963_795_964, suffix="o") == "157.4 Gio"
+
+
+def test_staged_output(tmp_path):
+    output = tmp_path / "file-w.jpg"
+    staging = tmp_path / "staging"
+
+    assert staged_output(output, None) == output
+
+    staged = staged_output(output, staging)
+    assert staged.parent == staging
+    assert staged.name.endswith("-file-w.jpg")
+    assert staged_output(output, staging) != staged
+
+    # Existing files are not staged
+    output.touch()
+    assert staged_output(output, staging) == output
@@ -7,7 +7,16 @@ You can always get the latest version of this module at:
     https://github.com/BoboTiG/watermark-me
 If that URL should fail, try contacting the author.
 """
-from watermark.watermark import add_watermark, apply_watermarks
+import pytest
+from PIL import Image, ImageFont
+from watermark.conf import CONF
+from watermark.watermark import (
+    add_watermark,
+    apply_watermarks,
+    fit_text,
+    load_picture,
+    set_opacity,
+)
 from watermark.utils import guess_output
 
 
@@ -85,6 +94,85 @@ def test_apply_watermark(tmp_path, location, picture, png):
         assert guess_output(file).is_file()
 
 
+def test_apply_watermark_generator(tmp_path, png):
+    """Test apply watermarks to files given by a generator."""
+    paths = (png(tmp_path / f"picture-{n}.png") for n in range(3))
+    results = list(apply_watermarks(paths, text="foo", picture=""))
+
+    assert len(results) == 3
+    for file, output, size_orig, size_new in results:
+        assert output == guess_output(file)
+        assert size_orig == file.stat().st_size
+        assert size_new == output.stat().st_size
+
+    # Already processed files have the same sizes
+    paths = [file for file, *_ in results]
+    assert list(apply_watermarks(paths, text="foo", picture="")) == results
+
+
+def test_apply_watermark_strings(tmp_path, png):
+    """Test apply watermarks to files given as strings."""
+    image = png(tmp_path / "picture.png")
+
+    ((file, output, *_),) = apply_watermarks([str(image)], text="foo", picture="")
+    assert file == image
+    assert output == guess_output(image)
+    assert output.is_file()
+
+
+def test_apply_watermark_staging(tmp_path, png):
+    """Test apply watermarks with a staging folder."""
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    image = png(tmp_path / "picture.png")
+
+    ((file, output, _, size_new),) = apply_watermarks(
+        [image], text="foo", picture="", staging=staging
+    )
+    assert file == image
+    assert output.parent == staging
+    assert output.stat().st_size == size_new
+    assert not guess_output(image).exists()
+
+
+@pytest.mark.parametrize("width", [1, 50, 333, 1920, 6000])
+def test_fit_text(width):
+    """Test the font size is the smallest one filling the width."""
+    text = "www.arresto-momentum.com"
+    font, n_width, n_height = fit_text(text, width)
+
+    assert font.size % 2 == 0
+    assert font.getsize(text) == (n_width, n_height)
+    assert n_width + n_height >= width
+    if font.size > 2:
+        smaller_width, smaller_height = ImageFont.truetype(
+            CONF.font, font.size - 2
+        ).getsize(text)
+        assert smaller_width + smaller_height < width
+
+
+def test_set_opacity():
+    """Test the alpha channel scaling."""
+    img = Image.new("RGBA", (2, 1), (10, 20, 30, 200))
+    img.putpixel((1, 0), (10, 20, 30, 255))
+
+    set_opacity(img, 0.5)
+
+    assert img.getpixel((0, 0)) == (10, 20, 30, 100)
+    assert img.getpixel((1, 0)) == (10, 20, 30, 127)
+
+
+def test_load_picture(picture, monkeypatch):
+    """Test the picture watermark is loaded only once."""
+    watermark_img = load_picture(picture)
+    assert watermark_img.mode == "RGBA"
+    assert load_picture(picture) is watermark_img
+
+    # The cache is invalidated when the opacity changes
+    monkeypatch.setattr(CONF, "opacity", CONF.opacity / 2)
+    assert load_picture(picture) is not watermark_img
+
+
 def test_file_not_an_image(location):
     """Test a file that is not an image."""
     img = add_watermark(location.parent / "conftest.py", text="foo")
@@ -0,0 +1,151 @@
+"""
+GUI to watermark your pictures with text and/or another picture.
+
+This module is maintained by Mickaël Schoentgen <contact@tiger-222.fr>.
+
+You can always get the latest version of this module at:
+    https://github.com/BoboTiG/watermark-me
+If that URL should fail, try contacting the author.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Tuple
+from unittest.mock import patch
+
+import pytest
+import tinify
+from PyQt5.QtCore import QCoreApplication, QTimer
+from watermark.gui import worker
+from watermark.gui.cache import Cache
+from watermark.gui.worker import Batch
+
+# path_orig, path_new, size_before, size_after
+Done = Tuple[Path, Path, int, int]
+
+
+@pytest.fixture(scope="module")
+def app() -> QCoreApplication:
+    """Return the application, needed to deliver signals."""
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def run(app):
+    """Run a batch until it is done, and return files reported by the fileDone signal."""
+
+    def run_batch(batch: Batch, paths: Iterable[Path]) -> List[Done]:
+        done: List[Done] = []
+        batch.signals.fileDone.connect(lambda *args: done.append(args))
+        batch.signals.allDone.connect(app.quit)
+
+        # Safety net, to not hang forever on failure
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(app.quit)
+        timer.start(30_000)
+
+        batch.start(str(path) for path in paths)
+        app.exec_()
+
+        assert timer.isActive(), "The batch did not finish in time"
+        timer.stop()
+        return sorted(done)
+
+    return run_batch
+
+
+class SourceMocked:
+    """Mock of tinify.Source, failing for files named "bad-w.jpg"."""
+
+    def __init__(self, path: str) -> None:
+        if Path(path).name == "bad-w.jpg":
+            raise tinify.AccountError("Mock'ed error")
+
+    def to_buffer(self) -> bytes:
+        return b"optimized"
+
+
+def test_batch(tmp_path, png, run):
+    """Test results and sizes reported by a batch."""
+    for name in ("a", "b", "c"):
+        png(tmp_path / f"{name}.png")
+
+    done = run(Batch("confidential", ""), [tmp_path])
+
+    assert len(done) == 3
+    for path_orig, path_new, size_before, size_after in done:
+        assert path_new == tmp_path / f"{path_orig.stem}-w.jpg"
+        assert path_new.is_file()
+        assert size_before == path_orig.stat().st_size
+        assert size_after == path_new.stat().st_size
+
+
+def test_batch_same_output(tmp_path, png, run):
+    """Test files that would be written to the same output."""
+    png(tmp_path / "a.png")
+    (tmp_path / "a.jpg").write_bytes((tmp_path / "a.png").read_bytes())
+
+    done = run(Batch("confidential", ""), [tmp_path / "a.png", tmp_path / "a.jpg"])
+
+    assert len(done) == 1
+    assert done[0][1] == tmp_path / "a-w.jpg"
+    assert sorted(tmp_path.glob("*-w.jpg")) == [tmp_path / "a-w.jpg"]
+
+
+def test_batch_optimization_failure(tmp_path, png, run):
+    """Test a failed optimization keeps the watermarked file, and it is not cached."""
+    png(tmp_path / "good.png")
+    png(tmp_path / "bad.png")
+    cache = Cache(tmp_path / "cache.db")
+    tinify.compression_count = 0
+
+    with ThreadPoolExecutor() as optimizer, patch.object(
+        tinify, "from_file", new=SourceMocked
+    ):
+        batch = Batch("confidential", "", optimizer=optimizer, cache=cache, conf="k")
+        done = run(batch, [tmp_path])
+
+    assert [path_new for _, path_new, _, _ in done] == [
+        tmp_path / "bad-w.jpg",
+        tmp_path / "good-wo.jpg",
+    ]
+    assert not (tmp_path / "good-w.jpg").exists()
+    assert not (tmp_path / "bad-wo.jpg").exists()
+
+    assert cache.lookup(tmp_path / "good.png", "k")
+    assert cache.lookup(tmp_path / "bad.png", "k") is None
+
+
+def test_batch_staging(tmp_path, png, run, monkeypatch):
+    """Test staged files are moved to their destination, and the staging folder removed."""
+    png(tmp_path / "a.png")
+    png(tmp_path / "b.png")
+    monkeypatch.setattr(worker, "use_staging", lambda folder, mounts=None: True)
+
+    batch = Batch("confidential", "")
+    done = run(batch, [tmp_path])
+
+    assert [path_new for _, path_new, _, _ in done] == [
+        tmp_path / "a-w.jpg",
+        tmp_path / "b-w.jpg",
+    ]
+    assert all(path_new.is_file() for _, path_new, _, _ in done)
+    assert not batch.staging.exists()
+
+
+def test_batch_cache(tmp_path, png, run, monkeypatch):
+    """Test a second run with the same options is served from the cache."""
+    png(tmp_path / "a.png")
+    png(tmp_path / "b.png")
+    cache = Cache(tmp_path / "cache.db")
+    paths = [tmp_path / "a.png", tmp_path / "b.png"]
+
+    first = run(Batch("confidential", "", cache=cache, conf="k"), paths)
+
+    def apply_watermarks(*args, **kwargs):
+        raise AssertionError("Files should not be processed again")
+
+    monkeypatch.setattr(worker, "apply_watermarks", apply_watermarks)
+    second = run(Batch("confidential", "", cache=cache, conf="k"), paths)
+
+    assert second == first
@@ -7,7 +7,31 @@ You can always get the latest version of this module at:
     https://github.com/BoboTiG/watermark-me
 If that URL should fail, try contacting the author.
 """
+import os
+import re
 from pathlib import Path
+from typing import Match, Optional
+from uuid import uuid4
+
+from .constants import LINUX, WINDOWS
+
+# Binary prefixes used by sizeof_fmt()
+_UNITS = ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi")
+
+# File systems types of network shares, as seen in /proc/mounts
+_NETWORK_FS = {
+    "9p",
+    "afs",
+    "ceph",
+    "cifs",
+    "fuse.sshfs",
+    "glusterfs",
+    "ncpfs",
+    "nfs",
+    "nfs4",
+    "smb3",
+    "smbfs",
+}
 
 
 def guess_output(file: Path, optimized: bool = False) -> Path:
@@ -30,6 +54,87 @@ def guess_output(file: Path, optimized: bool = False) -> Path:
     return file.with_name(f"{basename}.jpg")
 
 
+def staged_output(output: Path, staging: Optional[Path]) -> Path:
+    """Get the file where to write a given *output*.
+    When a *staging* folder is given, and *output* does not exist yet, a unique file
+    in that folder is returned. It is up to the caller to move it to *output* later.
+    """
+    if staging is None or output.is_file():
+        return output
+    return staging / f"{uuid4().hex}-{output.name}"
+
+
+def is_remote(path: Path, mounts: Optional[str] = None) -> bool:
+    """Check if a given *path* is located on a network share.
+    On Linux, *mounts* is the /proc/mounts content (see read_mounts()), read when not given.
+    Only Linux and Windows are supported, False is returned on other OSes or on any error.
+    """
+    try:
+        if WINDOWS:
+            return _is_remote_windows(path)
+        if LINUX:
+            if mounts is None:
+                mounts = read_mounts()
+            return mount_fs_type(path, mounts) in _NETWORK_FS
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+def read_mounts() -> str:
+    """Get the /proc/mounts content, to be used by is_remote() for several paths.
+    An empty string is returned on other OSes than Linux, or on error.
+    """
+    if not LINUX:
+        return ""
+    try:
+        with open("/proc/mounts", encoding="utf-8") as fh:
+            return fh.read()
+    except OSError:
+        return ""
+
+
+def _is_remote_windows(path: Path) -> bool:
+    """Check if a given *path* is located on a network share, on Windows."""
+    import ctypes
+
+    drive = os.path.splitdrive(os.path.abspath(path))[0]
+    if drive.startswith("\\\\"):
+        # UNC path
+        return True
+
+    # DRIVE_REMOTE
+    kernel32 = getattr(ctypes, "windll").kernel32
+    return kernel32.GetDriveTypeW(f"{drive}\\") == 4
+
+
+def mount_fs_type(path: Path, mounts: str) -> str:
+    """Get the file system type of a given *path* from *mounts*, the /proc/mounts content.
+    The type of the deepest mount point containing *path* is returned.
+    """
+    path = Path(os.path.realpath(path))
+    fs_type, depth = "", -1
+
+    for line in mounts.splitlines():
+        try:
+            _, mount_point, mount_type = line.split()[:3]
+        except ValueError:
+            continue
+
+        # Spaces and such are octal-escaped
+        mount = Path(re.sub(r"\\([0-7]{3})", _unescape, mount_point))
+        # Later mount points hide earlier ones on the same folder
+        if len(mount.parts) >= depth and (mount == path or mount in path.parents):
+            fs_type, depth = mount_type, len(mount.parts)
+
+    return fs_type
+
+
+def _unescape(match: Match) -> str:
+    """Unescape an octal-escaped character from /proc/mounts."""
+    return chr(int(match.group(1), 8))
+
+
 def sizeof_fmt(num: int, suffix: str = "B") -> str:
     """
     Human readable version of file size.
@@ -45,9 +150,13 @@ def sizeof_fmt(num: int, suffix: str = "B") -> str:
         "157.4 Gio"
     Source: https://stackoverflow.com/a/1094933/1117028
     """
-    val = float(num)
-    for unit in ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"):
-        if abs(val) < 1024.0:
-            return f"{val:3.1f} {unit}{suffix}"
+    # The unit is directly deduced from the number of bits: one unit every 10 bits
+    idx = min((abs(num).bit_length() - 1) // 10, 8) if num else 0
+    val = num / (1 << (10 * idx))
+    if abs(val) >= 1024.0 and idx < 8:
+        # Huge numbers rounded up to the next unit by the float conversion
+        idx += 1
         val /= 1024.0
-    return f"{val:,.1f} Yi{suffix}"
+    if idx == 8:
+        return f"{val:,.1f} Yi{suffix}"
+    return f"{val:3.1f} {_UNITS[idx]}{suffix}"
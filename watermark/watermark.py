@@ -8,13 +8,20 @@ You can always get the latest version of this module at:
 If that URL should fail, try contacting the author.
 """
 import logging
+import os
 from pathlib import Path
-from typing import Any, Generator, List, Optional, Tuple
+from typing import Any, Dict, Generator, Iterable, Optional, Tuple, Union
 
-from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+from PIL import Image, ImageDraw, ImageFont
 
 from .conf import CONF
-from .utils import guess_output
+from .utils import guess_output, staged_output
+
+# Buffer size used to read and write pictures, to reduce the number of I/O syscalls
+IO_BUFFER = 1024 * 1024
+
+# Picture watermarks ready to be used, see load_picture()
+_PICTURES: Dict[Tuple[str, int, int, float], Image.Image] = {}
 
 
 def add_watermark(image: Path, text: str = "", picture: str = "") -> Optional[Path]:
@@ -22,19 +29,38 @@ def add_watermark(image: Path, text: str = "", picture: str = "") -> Optional[Pa
     using the specified *opacity*.
     Source: https://gist.github.com/makmac213/a4ab09f5a042c5477037
     """
-    output = guess_output(image)
+    return _add_watermark(image, text=text, picture=picture)[0]
+
+
+def _add_watermark(
+    image: Path,
+    text: str = "",
+    picture: str = "",
+    output: Optional[Path] = None,
+    io_buffer: int = IO_BUFFER,
+) -> Tuple[Optional[Path], int, int]:
+    """Same as add_watermark() but also return sizes of the original and watermarked files.
+    Sizes are retrieved from files already opened to prevent additional syscalls.
+    The result is saved to *output*, guessed from *image* when not specified.
+    """
+    output = output or guess_output(image)
 
     # We should not erase old work, stop here.
-    if output.is_file():
+    try:
+        size_new = output.stat().st_size
+    except FileNotFoundError:
+        pass
+    else:
         logging.info(f"{image} already processed")
-        return output
+        return output, image.stat().st_size, size_new
 
     try:
-        with image.open("rb") as finput:
+        with image.open("rb", buffering=io_buffer) as finput:
+            size_orig = os.fstat(finput.fileno()).st_size
             img = Image.open(finput).convert("RGB")
     except OSError:
         logging.warning(f"Skipping unprocessable {image}")
-        return None
+        return None, 0, 0
 
     if text:
         logging.info(f"Applying text watermark {text!r} on {image}")
@@ -43,27 +69,18 @@ def add_watermark(image: Path, text: str = "", picture: str = "") -> Optional[Pa
         logging.info(f"Applying picture watermark {picture!r} on {image}")
         img = add_picture_watermark(img, picture)
 
-    img.save(output, "JPEG")
-    return output
+    with output.open("wb", buffering=io_buffer) as foutput:
+        img.save(foutput, "JPEG")
+        size_new = foutput.tell()
+
+    return output, size_orig, size_new
 
 
 def add_picture_watermark(img: Image, watermark: str) -> Image:
     """Add a given picture *watermark* to a given *img* using the specified *opacity*.
     Source: https://gist.github.com/makmac213/a4ab09f5a042c5477037
     """
-    watermark_img = Image.open(watermark)
-
-    """
-    # Resize to 25% of real dimensions
-    w = int(watermark_img.size[0] * 0.25)
-    h = int(watermark_img.size[1] * 0.25)
-    watermark_img = watermark_img.resize((w, h), Image.ANTIALIAS)
-    """
-
-    if CONF.opacity:
-        alpha = watermark_img.split()[3]
-        alpha = ImageEnhance.Brightness(alpha).enhance(CONF.opacity)
-        watermark_img.putalpha(alpha)
+    watermark_img = load_picture(watermark)
 
     # Center
     position = (
@@ -71,11 +88,39 @@ def add_picture_watermark(img: Image, watermark: str) -> Image:
         int((img.size[1] - watermark_img.size[1]) / 2),
     )
 
-    final = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    final.paste(img, (0, 0))
-    final.paste(watermark_img, position, mask=watermark_img)
+    # Blend the watermark only where it lies, there is no need for a full-size intermediate picture
+    img.paste(watermark_img, position, mask=watermark_img)
+    return img
+
+
+def load_picture(watermark: str) -> Image:
+    """Load a given picture *watermark*, ready to be pasted using the specified *opacity*.
+    The result is cached and shared by all pictures until the file or the opacity changes,
+    so that it is decoded only once per batch. It must not be modified.
+    """
+    stat = os.stat(watermark)
+    key = (watermark, stat.st_mtime_ns, stat.st_size, CONF.opacity)
+
+    watermark_img = _PICTURES.get(key)
+    if watermark_img is None:
+        with Image.open(watermark) as source:
+            watermark_img = source.convert("RGBA")
+
+        """
+        # Resize to 25% of real dimensions
+        w = int(watermark_img.size[0] * 0.25)
+        h = int(watermark_img.size[1] * 0.25)
+        watermark_img = watermark_img.resize((w, h), Image.ANTIALIAS)
+        """
+
+        if CONF.opacity:
+            set_opacity(watermark_img, CONF.opacity)
+
+        # Only the last picture is kept
+        _PICTURES.clear()
+        _PICTURES[key] = watermark_img
 
-    return Image.composite(final, img, final)
+    return watermark_img
 
 
 def add_text_watermark(img: Image, watermark: str) -> Image:
@@ -83,41 +128,106 @@ def add_text_watermark(img: Image, watermark: str) -> Image:
     *font* is the full path to the TrueType file.
     Source: http://www.pythoncentral.io/watermark-images-python-2x/
     """
-    watermark_img = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    n_font, n_width, n_height = fit_text(watermark, img.size[0])
 
-    size = 2
-    n_font = ImageFont.truetype(CONF.font, size)
-    n_width, n_height = n_font.getsize(watermark)
-
-    while n_width + n_height < watermark_img.size[0]:
-        size += 2
-        n_font = ImageFont.truetype(CONF.font, size)
-        n_width, n_height = n_font.getsize(watermark)
+    # The text is drawn on a picture just big enough to contain it (plus a margin for glyphs overhangs)
+    margin = n_height
+    watermark_img = Image.new(
+        "RGBA", (n_width + 2 * margin, n_height + 2 * margin), (0, 0, 0, 0)
+    )
+    # Center (the fractional part is kept for the text anti-aliasing)
+    x = (img.size[0] - n_width) / 2
+    y = (img.size[1] - n_height) / 2
+    position = (int(x) - margin, int(y) - margin)
 
     draw = ImageDraw.Draw(watermark_img, "RGBA")
     draw.text(
-        ((watermark_img.size[0] - n_width) / 2, (watermark_img.size[1] - n_height) / 2),
-        # ((watermark_img.size[0] - n_width) / 2, 10),
+        (x - position[0], y - position[1]),
         watermark,
         font=n_font,
         fill=CONF.text_color,
     )
 
-    alpha = watermark_img.split()[3]
-    alpha = ImageEnhance.Brightness(alpha).enhance(CONF.opacity)
-    watermark_img.putalpha(alpha)
+    set_opacity(watermark_img, CONF.opacity)
+
+    img.paste(watermark_img, position, mask=watermark_img)
+    return img
+
+
+def set_opacity(img: Image, opacity: float) -> None:
+    """Scale the alpha channel of a given RGBA *img* by *opacity*, in place.
+    A lookup table is used so that the whole channel is converted in a single pass.
+    """
+    lut = [int(value * opacity) for value in range(256)]
+    img.putalpha(img.getchannel("A").point(lut))
 
-    return Image.composite(watermark_img, img, watermark_img)
+
+def fit_text(text: str, width: int) -> Tuple[ImageFont.FreeTypeFont, int, int]:
+    """Find the smallest font size (an even number) for the *text* width + height to fill the given *width*.
+    Return the font, and the text width and height.
+
+    Text metrics are almost proportional to the font size, so the size is first guessed
+    from a reference one, then adjusted. Only a few fonts are loaded instead of one per size.
+    """
+
+    def measure(size: int) -> Tuple[ImageFont.FreeTypeFont, int, int]:
+        font = ImageFont.truetype(CONF.font, size)
+        return (font, *font.getsize(text))
+
+    ref = 100
+    _, n_width, n_height = measure(ref)
+    size = max(2, int(width * ref / max(n_width + n_height, 1)) // 2 * 2)
+    n_font, n_width, n_height = measure(size)
+
+    if n_width + n_height < width:
+        # Too small
+        while n_width + n_height < width:
+            size += 2
+            n_font, n_width, n_height = measure(size)
+    else:
+        # Maybe too big
+        while size > 2:
+            smaller = measure(size - 2)
+            if smaller[1] + smaller[2] < width:
+                break
+            size -= 2
+            n_font, n_width, n_height = smaller
+
+    return n_font, n_width, n_height
 
 
 def apply_watermarks(
-    paths: List[Path], text: str, picture: str, **kwargs: Any
-) -> Generator[Tuple[Path, Optional[Path]], None, None]:
-    """Apply watermark(s) on given files."""
-    for path in paths:
+    paths: Iterable[Union[str, os.PathLike]],
+    text: str,
+    picture: str,
+    staging: Optional[Path] = None,
+    io_buffer: int = IO_BUFFER,
+    **kwargs: Any,
+) -> Generator[Tuple[Path, Optional[Path], int, int], None, None]:
+    """Apply watermark(s) on given files.
+    *paths* is consumed lazily, it can be a generator of Path objects or strings.
+    When *staging* is set, new files are written into that folder (see staged_output()).
+    *io_buffer* is the buffer size used to read and write pictures.
+    Yield tuples (original file, watermarked file, original size, watermarked size).
+    """
+
+    for file in iter_files(paths):
+        output = staged_output(guess_output(file), staging)
+        yield (
+            file,
+            *_add_watermark(
+                file, text=text, picture=picture, output=output, io_buffer=io_buffer
+            ),
+        )
+
+
+def iter_files(
+    paths: Iterable[Union[str, os.PathLike]]
+) -> Generator[Path, None, None]:
+    """Yield files to process from given *paths*, folders are walked recursively."""
+    for path in map(Path, paths):
         if path.is_file():
-            yield path, add_watermark(path, text=text, picture=picture)
+            yield path
         elif path.is_dir():
             for ext in CONF.extensions:
-                for file in path.glob(f"**/*.{ext}"):
-                    yield file, add_watermark(file, text=text, picture=picture)
+                yield from path.glob(f"**/*.{ext}")